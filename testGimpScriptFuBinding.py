@@ -47,27 +47,286 @@ Use a template to call it.
 Iterate, fuzz the template over edge tests for GIMP types.
 """
 
+from collections import OrderedDict
+from contextlib import contextmanager
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
 from gimpfu import *
+from gi.repository import Gimp
 
 failed_tests = {}
 
-def test(description, construct, expected_status):
+# (description, construct, expected_status, actual_status, cacheable, mutates) of each case run, in order
+cases = []
+
+# Whether test() only appends to cases, without evaluating. Set by stress_func.
+collect_only = False
+
+# (image, drawable) whose state is rolled back after cases that mutate it, or None.
+# Set by plugin_func.
+isolation_fixture = None
+
+
+"""
+State snapshot and rollback.
+
+Some cases mutate shared GIMP state:
+context (line dash pattern, background), colormap of image 1,
+global parasites, pixels of the active drawable of image 1,
+and create new images.
+Rolling back makes each case independent of the cases before it,
+and is cheaper than creating a fresh image and context per case.
+
+Each case declares the parts of state it mutates,
+and only those parts are snapshot and restored.
+Most cases fail in ScriptFu's binding or only read state, and declare none.
+Neither a case nor its rollback is recorded in the undo history of image 1.
+
+Not rolled back: the clipboard (no case reads it.)
+"""
+
+# Parts of state a case may mutate, for the mutates argument of test()
+STATE_CONTEXT = "context"
+STATE_COLORMAP = "colormap"
+STATE_PARASITES = "parasites"
+STATE_PIXELS = "pixels"
+STATE_IMAGES = "images"
+ALL_STATE = (STATE_CONTEXT, STATE_COLORMAP, STATE_PARASITES, STATE_PIXELS, STATE_IMAGES)
+
+# Name of the GIMP named buffer holding the snapshot of the drawable's pixels
+SNAPSHOT_BUFFER_NAME = "testGimpScriptFuBinding-snapshot"
+
+
+@contextmanager
+def isolated(mutates):
+    """
+    Context that rolls back, on exit, the parts of state in mutates of isolation_fixture.
+
+    Restoring makes PDB calls, so read the status of a case inside the context.
+    Does nothing when isolation_fixture is None or mutates is empty.
+    Always pops the context, thaws undo and deletes the named buffer,
+    even when the snapshot or the restore fails.
+    """
+    if not isolation_fixture or not mutates:
+        yield
+        return
+
+    image, drawable = isolation_fixture
+    snapshot = {}
+    is_frozen = False
+    is_pushed = False
+    try:
+        if STATE_IMAGES in mutates:
+            num_images, images = pdb.gimp_image_list()
+            snapshot["image_ids"] = {each.ID for each in images}
+        if STATE_COLORMAP in mutates:
+            snapshot["colormap"] = pdb.gimp_image_get_colormap(image)
+        if STATE_PARASITES in mutates:
+            num_parasites, parasite_names = pdb.gimp_get_parasite_list()
+            snapshot["parasites"] = {name: pdb.gimp_get_parasite(name) for name in parasite_names}
+        if STATE_PIXELS in mutates:
+            # Copy pixels to a named buffer, which unlike gimp-edit-copy leaves the clipboard alone.
+            snapshot["buffer_name"] = pdb.gimp_edit_named_copy(1, [drawable], SNAPSHOT_BUFFER_NAME)
+        if STATE_COLORMAP in mutates or STATE_PIXELS in mutates:
+            pdb.gimp_image_undo_freeze(image)
+            is_frozen = True
+        if STATE_CONTEXT in mutates:
+            pdb.gimp_context_push()
+            is_pushed = True
+        yield
+    finally:
+        try:
+            restore_state(image, drawable, snapshot)
+        finally:
+            if "buffer_name" in snapshot:
+                pdb.gimp_buffer_delete(snapshot["buffer_name"])
+            if is_frozen:
+                pdb.gimp_image_undo_thaw(image)
+            if is_pushed:
+                pdb.gimp_context_pop()
+
+
+def restore_state(image, drawable, snapshot):
+    """ Restore the parts of state in snapshot, a dictionary filled by isolated(). """
+    if "image_ids" in snapshot:
+        num_images, images = pdb.gimp_image_list()
+        for each in images:
+            if each.ID not in snapshot["image_ids"]:
+                pdb.gimp_image_delete(each)
+
+    if "colormap" in snapshot:
+        num_bytes, colormap = snapshot["colormap"]
+        if num_bytes > 0:
+            pdb.gimp_image_set_colormap(image, num_bytes, colormap)
+
+    if "parasites" in snapshot:
+        num_parasites, parasite_names = pdb.gimp_get_parasite_list()
+        for name in parasite_names:
+            if name not in snapshot["parasites"]:
+                pdb.gimp_detach_parasite(name)
+        for parasite in snapshot["parasites"].values():
+            pdb.gimp_attach_parasite(parasite)
+
+    if "buffer_name" in snapshot:
+        # Anchor in Replace mode, so the pixels (including alpha) are replaced, not blended
+        floating_sel = pdb.gimp_edit_named_paste(drawable, snapshot["buffer_name"], False)
+        pdb.gimp_layer_set_mode(floating_sel, LAYER_MODE_REPLACE)
+        pdb.gimp_floating_sel_anchor(floating_sel)
+
+
+"""
+Memoization of results.
+
+Answers a construct evaluated before, by the same GIMP build on the same fixture,
+without evaluating it.
+The build is identified by the files of ScriptFu and libgimp,
+so rebuilding GIMP invalidates the memo.
+Persists across runs, evicting the least recently used entries.
+
+Only for constructs marked cacheable: without side effects and deterministic.
+Only the status is memoized.
+plug-in-script-fu-eval returns no values from the evaluated construct,
+so there is no result to memoize.
+"""
+
+MEMO_PATH = os.path.expanduser("~/.cache/testGimpScriptFuBinding/memo.json")
+MEMO_MAX_ENTRIES = 2000
+
+# OrderedDict from key to status, least recently used first, or None.
+# Set by plugin_func.
+memo = None
+# GIMP build and fixture signature, part of every key. Set by plugin_func.
+memo_context = None
+memo_hits = 0
+
+
+def gimp_build_signature():
+    """
+    Return a list identifying the GIMP build, or None when its files can't be found.
+
+    The version, and the path, size and mtime of the script-fu plug-in
+    and of the libgimp libraries (including libgimp-scriptfu, holding scheme-wrapper.c)
+    in the directory of the libgimp this process loaded.
+    """
+    paths = glob.glob(os.path.join(Gimp.plug_in_directory(), "plug-ins", "script-fu", "script-fu*"))
+    try:
+        with open("/proc/self/maps") as maps:
+            loaded = {line.split()[-1] for line in maps if "libgimp" in line}
+    except OSError:
+        loaded = set()
+    for library_dir in {os.path.dirname(path) for path in loaded}:
+        paths += glob.glob(os.path.join(library_dir, "libgimp*"))
+
+    if not paths or not loaded:
+        return None
+    signature = [pdb.gimp_version()]
+    for path in sorted(set(paths)):
+        status = os.stat(path)
+        signature.append([path, status.st_size, status.st_mtime_ns])
+    return signature
+
+
+def fixture_signature(image, drawable, is_isolated):
+    """
+    Return a list describing the fixture that constructs are evaluated against.
+
+    Without isolation, state left by earlier cases is also part of the fixture,
+    so the signature includes whether cases are isolated.
+    """
+    return [image.ID, drawable.ID, image.width, image.height, image.base_type,
+            drawable.has_alpha, is_isolated]
+
+
+def memo_key(construct):
+    """ Return hash of the normalized construct and memo_context. """
+    data = parse_scheme(construct)
+    if data is None:
+        normalized = " ".join(construct.split())
+    else:
+        normalized = " ".join(unparse_scheme(datum) for datum in data)
+    text = json.dumps([normalized, memo_context])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load_memo():
+    """ Return memo read from MEMO_PATH, empty if none, unreadable or not a memo. """
+    try:
+        with open(MEMO_PATH) as memo_file:
+            loaded = OrderedDict(json.load(memo_file))
+        if not all(isinstance(key, str) and isinstance(status, str) for key, status in loaded.items()):
+            raise ValueError("entries are not key and status")
+        return loaded
+    except (OSError, ValueError, TypeError) as err:
+        print(f"Memo not loaded: {err}")
+        return OrderedDict()
+
+
+def save_memo():
+    """ Write memo to MEMO_PATH. """
+    os.makedirs(os.path.dirname(MEMO_PATH), exist_ok=True)
+    with open(MEMO_PATH, "w") as memo_file:
+        json.dump(list(memo.items()), memo_file)
+
+
+def evaluate(construct, cacheable=False, mutates=()):
+    """
+    Evaluate a scriptfu construct, return text of PDB status result.
+
+    When memo is set and construct is cacheable, may answer from memo without evaluating.
+    When isolation_fixture is set, rolls back the parts of state in mutates.
+    """
+    global memo_hits
+
+    if memo is not None and cacheable:
+        key = memo_key(construct)
+        if key in memo:
+            memo.move_to_end(key)
+            memo_hits += 1
+            return memo[key]
+
+    with isolated(mutates):
+        # scriptfu evaluate
+        pdb.plug_in_script_fu_eval(construct)
+        # Read status before rollback, which itself calls the PDB
+        status = pdb.get_last_error()
+
+    if memo is not None and cacheable:
+        memo[key] = status
+        if len(memo) > MEMO_MAX_ENTRIES:
+            memo.popitem(last=False)
+    return status
+
+
+def test(description, construct, expected_status, cacheable=False, mutates=()):
     """
     Test a scriptfu construct.
 
     description: informal string
     construct: Scriptfu Scheme text
     expected: expected text of PDB status result
+    cacheable: whether the result may be memoized.
+       True only when the construct fails in ScriptFu's binding (before calling the procedure)
+       or is otherwise pure: no side effects, and depends on no state.
+    mutates: parts of state (STATE_*) the construct may change, to be rolled back
     """
     global failure_count
 
+    if collect_only:
+        cases.append((description, construct, expected_status, None, cacheable, mutates))
+        return
+
     print(f"\nCase: {description}")
 
-    # scriptfu evaluate
-    pdb.plug_in_script_fu_eval(construct)
+    actual_status = evaluate(construct, cacheable, mutates)
+    cases.append((description, construct, expected_status, actual_status, cacheable, mutates))
 
     # Compare <status of last PDB call> to <expected_status>.
-    actual_status = pdb.get_last_error()
     if actual_status == expected_status:
         print("Pass")
     else:
@@ -78,15 +337,320 @@ def test(description, construct, expected_status):
 # !!! Some expected strings have trailing space and newline
 
 
-def plugin_func(image, drawable):
-    print("plugin_func called")
+"""
+Coverage-guided fuzzing.
+
+Coverage is measured by the status results, not by instrumenting scheme-wrapper.c.
+Each distinct normalized status (a signature) is a bucket,
+approximating a distinct path through scheme-wrapper.c.
+Keeps a corpus of constructs that reached new buckets,
+and mutates the most productive ones.
+"""
+
+# Procedures not to fuzz, neither seeds nor mutations calling them.
+# extension-gimp-help never returns when passed valid args.
+# gimp-display-new opens windows that a mutated construct may not delete.
+FUZZ_EXCLUDED_PROCEDURES = ("extension-gimp-help", "gimp-display-new")
+
+# Forms of mutations not to evaluate, as they appear in text from unparse_scheme().
+# An empty list for a GimpObjectArray crashes GIMP, see case "len 1, but empty list passed".
+FUZZ_EXCLUDED_FORMS = (
+    re.compile(r"\(gimp-edit-(copy|cut|named-copy|named-cut) \S+ '?\(\)"),
+    )
+
+# Data substituted for arguments and elements of containers.
+# None call PDB procedures, so a mutation calls no more procedures than its seed.
+FUZZ_DATA = (
+    "0", "1", "-1", "2", "1.01", "4294967295",
+    '""', '"foo"', "#t", "NIL", "drawable",
+    "#()", "#(1.0)", '#("foo")', "'#(1)",
+    "()", "'()", "'(1.0)", """'("foo" "bar")""", "'(1 2 3)",
+    "(1)", "(vector 1)",
+    )
+
+PROCEDURE_NAME = re.compile(r"\b(gimp|file|plug-in|python-fu|script-fu|extension)-[\w-]+")
+
+SCHEME_TOKEN = re.compile(r'''\s*("(?:\\.|[^"\\])*"|'?#?\(|\)|'?[^\s()"']+)''')
+
+
+def parse_scheme(text):
+    """
+    Parse Scheme text into a list of data.
+
+    A datum is either an atom (a string)
+    or a list [opener, datum, ...] where opener is one of ( '( #( '#(
+    Returns None when the text is not balanced.
+    """
+    stack = [[None]]
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = SCHEME_TOKEN.match(text, position)
+        if not match:
+            return None
+        position = match.end()
+        token = match.group(1)
+        if token.endswith("(") and not token.startswith('"'):
+            stack.append([token])
+        elif token == ")":
+            if len(stack) == 1:
+                return None
+            datum = stack.pop()
+            stack[-1].append(datum)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1:
+        return None
+    return stack[0][1:]
+
+
+def unparse_scheme(datum):
+    """ Inverse of parse_scheme, for one datum. """
+    if isinstance(datum, str):
+        return datum
+    return datum[0] + " ".join(unparse_scheme(child) for child in datum[1:]) + ")"
+
+
+def mutable_positions(datum, positions):
+    """
+    Append to positions the (list, index) of each datum that a mutation may change.
 
+    Does not include the procedure name at the head of a call,
+    nor a run mode, since other run modes may open dialogs and block fuzzing.
     """
-    Order of  is important.
-    Some tests depend on objects created by earlier tests,
-    assuming a basic image was opened
-    and not requiring the opened image to have any particular objects.
+    if isinstance(datum, str):
+        return
+    if datum[0] == "(" and len(datum) > 1 and isinstance(datum[1], str):
+        first = 2
+    else:
+        first = 1
+    for index in range(first, len(datum)):
+        if not (isinstance(datum[index], str) and datum[index].startswith("RUN-")):
+            positions.append((datum, index))
+    for child in datum[1:]:
+        mutable_positions(child, positions)
+
+
+def calls_procedure(datum):
+    """ Whether datum is or contains a call to a PDB procedure. """
+    if isinstance(datum, str):
+        return False
+    if datum[0] == "(" and len(datum) > 1 and isinstance(datum[1], str) and PROCEDURE_NAME.match(datum[1]):
+        return True
+    return any(calls_procedure(child) for child in datum[1:])
+
+
+def mutate(construct, corpus, rng):
+    """
+    Return a mutation of construct: one to three substitutions, deletions, duplications or splices.
+
+    Splices take a datum from another construct in the corpus.
+    Neither duplicates nor splices calls to PDB procedures,
+    so a mutation calls no more procedures than construct.
+    Returns construct unchanged if it can't be parsed or has nothing to mutate.
+    """
+    data = parse_scheme(construct)
+    if data is None:
+        return construct
+
+    for _ in range(rng.randint(1, 3)):
+        positions = []
+        for datum in data:
+            mutable_positions(datum, positions)
+        if not positions:
+            break
+        parent, index = rng.choice(positions)
+        kind = rng.randrange(4)
+        if kind == 0:
+            parent[index] = rng.choice(FUZZ_DATA)
+        elif kind == 1:
+            del parent[index]
+        elif kind == 2:
+            if not calls_procedure(parent[index]):
+                parent.insert(index, parent[index])
+        else:
+            donor = parse_scheme(rng.choice(corpus)["construct"]) or []
+            donor_positions = []
+            for datum in donor:
+                mutable_positions(datum, donor_positions)
+            donor_positions = [(donor_parent, donor_index) for donor_parent, donor_index in donor_positions
+                               if not calls_procedure(donor_parent[donor_index])]
+            if donor_positions:
+                donor_parent, donor_index = rng.choice(donor_positions)
+                parent[index] = donor_parent[donor_index]
+
+    return " ".join(unparse_scheme(datum) for datum in data)
+
+
+def status_signature(status):
+    """
+    Normalize a status into a signature that identifies its path through scheme-wrapper.c.
+
+    E.G. "Error: in script, expected type: vector for argument 2 to gimp-edit-copy  \n"
+    and  "Error: in script, expected type: vector for argument 1 to gimp-foo  \n"
+    both yield "Error: in script, expected type: vector for argument N to PROCEDURE"
+    """
+    signature = status.strip()
+    # Text after these comes from the called procedure or the script, not from scheme-wrapper.c
+    signature = re.sub(r"(Procedure execution of \S+ failed( on invalid input arguments)?).*",
+                       r"\1", signature)
+    signature = re.sub(r"(unbound variable:).*", r"\1 SYMBOL", signature)
+    signature = re.sub(r"(in drawable vector).*", r"\1", signature)
+    signature = re.sub(r"( to \S+)\s.*", r"\1", signature)
+    signature = PROCEDURE_NAME.sub("PROCEDURE", signature)
+    signature = re.sub(r"'[^']*'", "'STRING'", signature)
+    signature = re.sub(r"-?\d+(\.\d+)?", "N", signature)
+    return signature
+
+
+def is_fuzz_excluded(construct):
+    """ Whether construct calls an excluded procedure or has an excluded form. """
+    return (any(name in construct for name in FUZZ_EXCLUDED_PROCEDURES)
+            or any(form.search(construct) for form in FUZZ_EXCLUDED_FORMS))
+
+
+def fuzz(budget, seed=None):
+    """
+    Fuzz constructs of the cases already run, for budget evaluations.
+
+    Each pick of a corpus entry is weighted by the buckets its mutations found per pick,
+    so effort goes to the most productive entries.
+    Mutations are not cacheable: they may have side effects their seeds don't.
+    Fuzzes only when cases are isolated, since mutations may mutate any state and create images.
+    Returns dictionary from signature to first construct that reached it.
+    """
+    rng = random.Random(seed)
+
+    if not isolation_fixture:
+        print("\nFuzz: not fuzzing, cases are not isolated")
+        return {}
+
+    coverage = {}
+    corpus = []
+    for description, construct, expected_status, actual_status, cacheable, mutates in cases:
+        signature = status_signature(actual_status)
+        if signature not in coverage:
+            coverage[signature] = construct
+        if not is_fuzz_excluded(construct):
+            corpus.append({"construct": construct, "picks": 0, "finds": 0})
+    print(f"\nFuzz: {len(corpus)} seeds reach {len(coverage)} signatures")
+    if not corpus:
+        return coverage
+
+    evaluations = 0
+    discards = 0
+    # Bound attempts, in case most mutations are excluded
+    while evaluations < budget and discards < 10 * budget:
+        weights = [(1 + entry["finds"]) / (1 + entry["picks"]) for entry in corpus]
+        entry = rng.choices(corpus, weights)[0]
+        entry["picks"] += 1
+
+        construct = mutate(entry["construct"], corpus, rng)
+        if is_fuzz_excluded(construct):
+            discards += 1
+            continue
+        evaluations += 1
+        # A mutation may mutate any state
+        signature = status_signature(evaluate(construct, mutates=ALL_STATE))
+        if signature not in coverage:
+            print(f"Fuzz: new signature after {evaluations} evals: {repr(signature)}")
+            print(f"   from: {construct}")
+            coverage[signature] = construct
+            entry["finds"] += 1
+            corpus.append({"construct": construct, "picks": 0, "finds": 0})
+
+    print(f"Fuzz: {evaluations} evals, {discards} excluded mutations,"
+          f" corpus {len(corpus)}, {len(coverage)} signatures")
+    return coverage
+
+
+"""
+Stress: concurrent clients.
+
+A client is one run of the procedure python-fu--script-fu-binding-stress,
+each run in its own plugin process, with its own last error.
+Start it several times, so GIMP receives plug-in-script-fu-eval from clients in parallel.
+(One plugin process can't: PDB calls block, and libgimp's connection is not thread safe.)
+
+A client evaluates, in shuffled rounds, the cases that mutate no state,
+so clients don't change what other clients' cases see, and need no rollback.
+Each client prints its throughput and the latency of its evals under the load of the others,
+and any status differing from the expected status.
+A differing status that is the expected error of another case
+likely is another client's error, i.e. corruption of the last error in GIMP or ScriptFu.
+Run the cases alone first (Test>ScriptFu binding): a failing case also differs here.
+"""
+
+STRESS_ROUNDS = 20
+
+
+def percentile(ordered, fraction):
+    """ Return the value at fraction (0 to 1) of ordered, a sorted nonempty list. """
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def stress_func(image, drawable):
+    """ Run as one stress client. """
+    global collect_only
+
+    client = os.getpid()
+    collect_only = True
+    try:
+        run_cases()
+    finally:
+        collect_only = False
+    stress_cases = [case for case in cases if not case[5]]
+    # Errors of cases, which identify the case; many cases have status "success"
+    case_errors = {case[2] for case in stress_cases} - {"success"}
+
+    print(f"\nStress client {client}: {STRESS_ROUNDS} rounds of {len(stress_cases)} cases")
+    rng = random.Random(client)
+    latencies = []
+    differing_count = 0
+    foreign_count = 0
+    start = time.perf_counter()
+    for _ in range(STRESS_ROUNDS):
+        rng.shuffle(stress_cases)
+        for description, construct, expected_status, actual_status, cacheable, mutates in stress_cases:
+            eval_start = time.perf_counter()
+            pdb.plug_in_script_fu_eval(construct)
+            status = pdb.get_last_error()
+            latencies.append(time.perf_counter() - eval_start)
+
+            if status != expected_status:
+                differing_count += 1
+                is_foreign = status in case_errors
+                if is_foreign:
+                    foreign_count += 1
+                # print with repr() so whitespace visible
+                print(f"Stress client {client}: case: {description}, expected:{repr(expected_status)},"
+                      f" actual:{repr(status)}" + (", error of another case" if is_foreign else ""))
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        return
+    ordered = sorted(latencies)
+    print(f"Stress client {client}: {len(latencies)} evals in {elapsed:.2f}s,"
+          f" {len(latencies) / elapsed:.1f} evals/s")
+    print(f"Stress client {client}: latency ms p50:{percentile(ordered, 0.5) * 1000:.1f}"
+          f" p95:{percentile(ordered, 0.95) * 1000:.1f}"
+          f" p99:{percentile(ordered, 0.99) * 1000:.1f}"
+          f" max:{ordered[-1] * 1000:.1f}")
+    print(f"Stress client {client}: {differing_count} statuses differ from expected,"
+          f" {foreign_count} are errors of another case")
+
+
+def run_cases():
+    """
+    Run the cases.
+
+    Tests assume a basic image was opened,
+    not requiring the opened image to have any particular objects.
     Test assume image with ID 1 is used for most tests.
+
+    When cases are isolated, state that cases mutate is rolled back after each case,
+    so cases don't depend on changes made by earlier cases.
+    Each case must create any objects it depends on.
     """
 
     # Don't test a version of Scriptuf that does fixup for certain errors
@@ -101,7 +665,8 @@ def plugin_func(image, drawable):
     test("Basic valid Scheme call to PDB",
         # literal 1 where enum expected
         "(gimp-unit-get-factor 1)",
-        "success")
+        "success",
+        cacheable=True)
 
 
     """
@@ -144,22 +709,26 @@ def plugin_func(image, drawable):
 
     test("invalid procedure name, not quoted",
         '(foo)',
-         "Error: eval: unbound variable: foo \n")
+         "Error: eval: unbound variable: foo \n",
+         cacheable=True)
 
     # ScriptFu allows you to quote, or not quote the first symbol??
     # in a list representing a call to PDB
     test("invalid procedure name, quoted",
         '("foo")',
-        "Error: illegal function \n")
+        "Error: illegal function \n",
+        cacheable=True)
 
     test("Excluded procedure: script-fu-refresh",
         '(script-fu-refresh RUN-NONINTERACTIVE)',
-        "Error: A script cannot refresh scripts \n")
+        "Error: A script cannot refresh scripts \n",
+        cacheable=True)
 
     # Each call to a PDB procedure returns a list, whose first element must be car'd
     test("Nested calls",
         '(gimp-image-get-active-drawable (car (gimp-image-new 10 30 1)))',
-        "success")
+        "success",
+        mutates=(STATE_IMAGES,))
 
 
     """
@@ -182,11 +751,13 @@ def plugin_func(image, drawable):
     # Now, should get warning in console, and but procedure not fail
     test("error: extra arg",
         "(gimp-unit-get-factor 1 2)",
-        "success")
+        "success",
+        cacheable=True)
 
     test("error: arg has wrong type",
         '(gimp-unit-get-factor "foo")',
-        "Error: in script, expected type: numeric for argument 1 to gimp-unit-get-factor  \n")
+        "Error: in script, expected type: numeric for argument 1 to gimp-unit-get-factor  \n",
+        cacheable=True)
 
 
     """
@@ -201,19 +772,23 @@ def plugin_func(image, drawable):
 
     test("error: array arg is not a container at all: 0 (some author's may mean empty list)",
         '(gimp-context-set-line-dash-pattern 2 0)',
-        "Error: in script, expected type: vector for argument 2 to gimp-context-set-line-dash-pattern  \n")
+        "Error: in script, expected type: vector for argument 2 to gimp-context-set-line-dash-pattern  \n",
+        cacheable=True)
 
     test("error: what some novices might try, NIL is not a symbol in TinyScheme",
         '(gimp-context-set-line-dash-pattern 2 NIL)',
-        "Error: eval: unbound variable: NIL \n")
+        "Error: eval: unbound variable: NIL \n",
+        cacheable=True)
 
     test("Not an error (if PDB procedure handles it): array arg is empty vector",
         '(gimp-context-set-line-dash-pattern 0 #() )',
-        "success")
+        "success",
+        mutates=(STATE_CONTEXT,))
 
     test("error: array arg is empty list, expected vector",
         '(gimp-context-set-line-dash-pattern 2 () )',
-        "Error: in script, expected type: vector for argument 2 to gimp-context-set-line-dash-pattern  \n")
+        "Error: in script, expected type: vector for argument 2 to gimp-context-set-line-dash-pattern  \n",
+        cacheable=True)
 
     # The test plugintaking a GStrv must exist, it is not in the GIMP repository.
     # When the test plugin does not exist, these tests fail with a different error message.
@@ -223,22 +798,26 @@ def plugin_func(image, drawable):
     # An unquoted list still is marshalled to an empty string array
     test("valid string array arg is empty, unquoted list",
         '(python-fu-test-take-string-array RUN-NONINTERACTIVE 1 1 () )',
-        "success")
+        "success",
+        mutates=ALL_STATE)
 
     # Valid, a quoted empty list yields a string array
     test("valid string array arg passed as empty quoted list",
         '''(python-fu-test-take-string-array RUN-NONINTERACTIVE 1 1 '() )''',
-        "success")
+        "success",
+        mutates=ALL_STATE)
 
     # Valid, a list of empty strings is an array of two empty strings
     test("valid string array arg passed as quoted list of empty count_strings",
         '''(python-fu-test-take-string-array RUN-NONINTERACTIVE 1 1 '("" "") )''',
-        "success")
+        "success",
+        mutates=ALL_STATE)
 
     # !!! Pass image ID, drawable ID, quoted list
     test("valid string array passed as a list",
         '''(python-fu-test-take-string-array RUN-NONINTERACTIVE 1 1 '("foo" "bar") )''',
-        "success")
+        "success",
+        mutates=ALL_STATE)
 
     """
     If G_MESSAGES_DEBUG=scriptfu, console should print like:
@@ -250,12 +829,14 @@ def plugin_func(image, drawable):
     test("error: vector passed for string array",
         # pass a vector where list expected
         '''(python-fu-test-take-string-array RUN-NONINTERACTIVE 1 1 #("foo" "bar") )''',
-        "execution error")  # OLD error message
+        "execution error",  # OLD error message
+        mutates=ALL_STATE)
         # NEW "Error: in script, expected type: list for argument 4 to python-fu-test-take-string-array  \n")
 
     test("error: array arg with wrong, longer length",
         '(gimp-context-set-line-dash-pattern 2 #(1.0))',
-        "Error: in script, vector (argument 2) for function gimp-context-set-line-dash-pattern has length 1 but expected length 2 \n")
+        "Error: in script, vector (argument 2) for function gimp-context-set-line-dash-pattern has length 1 but expected length 2 \n",
+        cacheable=True)
 
     test("error: array arg with wrong, shorter length",
         '(gimp-context-set-line-dash-pattern 0 #(1.0))',
@@ -263,25 +844,29 @@ def plugin_func(image, drawable):
         # The effect is: scriptfu calls PDB procedure with empty array.
         # The PDB procedure accepts an empty pattern without complaint.
         # The PDB procedure sets the dash pattern in the context to an empty pattern?
-        "success")
+        "success",
+        mutates=(STATE_CONTEXT,))
 
     test("error: array arg with negative length",
         '(gimp-context-set-line-dash-pattern -1 #(1.0))',
         # When assigned by ScriptFu to a guint, will be interpreted by C
         # as a large number and should fail.
-        "Error: in script, vector (argument 2) for function gimp-context-set-line-dash-pattern has length 1 but expected length 4294967295 \n")
+        "Error: in script, vector (argument 2) for function gimp-context-set-line-dash-pattern has length 1 but expected length 4294967295 \n",
+        cacheable=True)
 
     test("error: array arg with wrong lisp container type",
         # list literal given, vector literal expected
         # Note single quote is a lisp symbol for literal list
         "(gimp-context-set-line-dash-pattern 1 '(1.0))",
         # !!! Actual has two trailing spaces.
-        "Error: in script, expected type: vector for argument 2 to gimp-context-set-line-dash-pattern  \n")
+        "Error: in script, expected type: vector for argument 2 to gimp-context-set-line-dash-pattern  \n",
+        cacheable=True)
 
     test("error: array arg with wrong contained element type",
         # expected float array, received string in vector
         '(gimp-context-set-line-dash-pattern 1 #("foo"))',
-        '''Error: in script, expected type: numeric for element 1 of argument 2 to gimp-context-set-line-dash-pattern  #("foo") \n''')
+        '''Error: in script, expected type: numeric for element 1 of argument 2 to gimp-context-set-line-dash-pattern  #("foo") \n''',
+        cacheable=True)
 
     # tests for arg is StringArray
 
@@ -295,18 +880,21 @@ def plugin_func(image, drawable):
     test("error: invalid container type",
         # pass a vector where list expected
         '''(extension-gimp-help 1 #("foo") 1 '("bar"))''',
-        "Error: in script, expected type: list for argument 2 to extension-gimp-help  \n")
+        "Error: in script, expected type: list for argument 2 to extension-gimp-help  \n",
+        cacheable=True)
 
     test("error: invalid element type in container",
         # pass a list of numeric where list of string expected
         '''(extension-gimp-help 1 '(1.0) 1 '("bar"))''',
-        "Error: in script, expected type: string for element 1 of argument 2 to extension-gimp-help  (1.0) \n")
+        "Error: in script, expected type: string for element 1 of argument 2 to extension-gimp-help  (1.0) \n",
+        cacheable=True)
 
 
 
     test("error: wrong type where an image ID of type numeric should be passed",
         '(gimp-image-get-active-drawable "1")',
-        "Error: in script, expected type: numeric for argument 1 to gimp-image-get-active-drawable  \n")
+        "Error: in script, expected type: numeric for argument 1 to gimp-image-get-active-drawable  \n",
+        cacheable=True)
 
     """
     Test ScriptFu binding of args to PDB procedures, i.e. binding in forward direction
@@ -352,11 +940,13 @@ def plugin_func(image, drawable):
 
     test("Float array having one element",
         '(gimp-context-set-line-dash-pattern 1 #(1.666))',
-        "success")
+        "success",
+        mutates=(STATE_CONTEXT,))
 
     test("Float array having two elements",
         '(gimp-context-set-line-dash-pattern 2 #(1.666 3.14))',
-        "success")
+        "success",
+        mutates=(STATE_CONTEXT,))
 
 
     # gimp-image-set-colormap ( Image Int Int8Array ) =>
@@ -365,7 +955,8 @@ def plugin_func(image, drawable):
     # Can you set a colormap of one color?
     test("Int8Array",
         '(gimp-image-set-colormap 1 3 #(1 2 3))',
-        "success")
+        "success",
+        mutates=(STATE_COLORMAP,))
 
     # TODO file-gih-save takes a StringArray
     # The only procedure that does.
@@ -378,7 +969,8 @@ def plugin_func(image, drawable):
     # We expect it to bind, but to fail to find the file.
     test("Int32Array",
         '(file-pdf-load RUN-NONINTERACTIVE  "/tmp/foo.pdf" "password" 1 2 #(3 4))',
-        "Error: Procedure execution of file-pdf-load failed: Could not load '/tmp/foo.pdf': No such file or directory \n")
+        "Error: Procedure execution of file-pdf-load failed: Could not load '/tmp/foo.pdf': No such file or directory \n",
+        mutates=(STATE_IMAGES,))
 
     # TODO RGBArray
     # I can't find a procedure that takes.
@@ -389,31 +981,37 @@ def plugin_func(image, drawable):
     # gimp-attach-parasite ( Parasite ) =>
     test("Parasite: repr in ScriptFu is list literal '(name string, flags numeric, data string)",
         '''(gimp-attach-parasite '("foo" 1 "bar"))''',
-        "success")
+        "success",
+        mutates=(STATE_PARASITES,))
 
 
     test("RGB aka color: where arg is a literal tuple",
         "(gimp-context-set-background '( 1 2 3))",
-        "success")
+        "success",
+        mutates=(STATE_CONTEXT,))
 
     test("RGB : where arg is a name of type string",
         '(gimp-context-set-background "black")',
-        "success")
+        "success",
+        mutates=(STATE_CONTEXT,))
 
     # Scriptfu expects a list of length 3
     test("error: RGB aka color: where arg is a too-short list",
         "(gimp-context-set-background '( 1 2 ))",
-        "Error: in script, expected type: color string or list for argument 1 to gimp-context-set-background  \n")
+        "Error: in script, expected type: color string or list for argument 1 to gimp-context-set-background  \n",
+        cacheable=True)
 
     # Scriptfu expects a list of length 3 of numeric
     test("error: RGB aka color: where list is not of numeric",
         '''(gimp-context-set-background '( 1 2 "foo" ))''',
-        "Error: in script, expected type: numeric for element 3 of argument 1 to gimp-context-set-background  \n")
+        "Error: in script, expected type: numeric for element 3 of argument 1 to gimp-context-set-background  \n",
+        cacheable=True)
 
     # Scriptfu clamps to 255 without complaint
     test("error: RGB aka color: where arg is a tuple of too-large integers",
         "(gimp-context-set-background '( 512 666  64456))",
-        "success")
+        "success",
+        mutates=(STATE_CONTEXT,))
 
 
     # TODO move this
@@ -429,7 +1027,8 @@ def plugin_func(image, drawable):
 
     test("single GimpDrawable (a numeric ID in ScriptFu)",
         '(gimp-drawable-edit-clear (car (gimp-image-get-active-drawable  1)))',
-        "success")
+        "success",
+        mutates=(STATE_PIXELS,))
 
 
     """
@@ -468,11 +1067,13 @@ def plugin_func(image, drawable):
            (gimp-edit-copy 1 '#(drawable))
            )
         ''',
-        "Error: Expected numeric in drawable vector #(drawable) \n")
+        "Error: Expected numeric in drawable vector #(drawable) \n",
+        cacheable=True)
 
     test("Error: Second arg is type ObjectArray a quoted vector of strings",
         '''(gimp-edit-copy 1 '#("foo"))''',
-        '''Error: Expected numeric in drawable vector #("foo") \n''')
+        '''Error: Expected numeric in drawable vector #("foo") \n''',
+        cacheable=True)
 
 
     if do_test_fixup:
@@ -512,11 +1113,13 @@ def plugin_func(image, drawable):
 
     test("Error: second arg is type ObjectArray but unquoted list passed",
         '(gimp-edit-copy 1 (1))',
-        "Error: illegal function \n")
+        "Error: illegal function \n",
+        cacheable=True)
 
     test("Error: second arg is type ObjectArray but list of string passed",
         '(gimp-edit-copy 1 ("foo"))',
-        "Error: illegal function \n")
+        "Error: illegal function \n",
+        cacheable=True)
 
 
 
@@ -532,7 +1135,8 @@ def plugin_func(image, drawable):
     test("len 0 and empty vector passed for GimpObjectArray",
         "(gimp-edit-copy 0 #())",
         "Error: Procedure execution of gimp-edit-copy failed on invalid input arguments:"\
-             " Procedure 'gimp-edit-copy' has been called with value '0' for argument 'num-drawables' (#1, type gint). This value is out of range. \n")
+             " Procedure 'gimp-edit-copy' has been called with value '0' for argument 'num-drawables' (#1, type gint). This value is out of range. \n",
+        cacheable=True)
 
     test("invalid drawable ID",
         '(gimp-drawable-edit-clear 666)',
@@ -548,7 +1152,8 @@ def plugin_func(image, drawable):
         # GIMP 2 used two strings
         # The filename is bad, expect no errors in binding, but error in procedure
         '(gimp-file-load RUN-NONINTERACTIVE "/tmp/foo")',
-        "Error: Procedure execution of gimp-file-load failed: Error opening file /tmp/foo: No such file or directory \n")
+        "Error: Procedure execution of gimp-file-load failed: Error opening file /tmp/foo: No such file or directory \n",
+        mutates=(STATE_IMAGES,))
 
 
     """
@@ -573,7 +1178,8 @@ def plugin_func(image, drawable):
     test("Double result",
         # enum arg
         '(gimp-unit-get-factor 1)',
-        "success")
+        "success",
+        cacheable=True)
 
     test("String result",
         '(gimp-item-get-name 1)',
@@ -592,7 +1198,8 @@ def plugin_func(image, drawable):
     test("image result.",
         # 1 is literal for image type enum
         '(gimp-image-new 10 30 1)',
-        "success")
+        "success",
+        mutates=(STATE_IMAGES,))
 
     test("Drawable result: NULL i.e. -1",
         # Note each construct must create its own objects to pass to procedures.
@@ -601,7 +1208,8 @@ def plugin_func(image, drawable):
         # There is no active drawable for a new image, this returns -1
         # TODO therefore need a different script
         '(gimp-image-get-active-drawable (car (gimp-image-new 10 30 1)))',
-        "success")
+        "success",
+        mutates=(STATE_IMAGES,))
 
     test("GimpItem result",
         # gimp-item-get-parent ( Item ) => Item
@@ -627,9 +1235,14 @@ def plugin_func(image, drawable):
 
     test("Parasite result",
         # gimp-parasite-find ( String ) => Parasite
-        # find parasite we attached earlier?
-        '(gimp-get-parasite "foo")',
-        "success")
+        # attach the parasite first, cases don't see parasites attached by earlier cases
+        '''(begin
+             (gimp-attach-parasite '("foo" 1 "bar"))
+             (gimp-get-parasite "foo")
+           )
+        ''',
+        "success",
+        mutates=(STATE_PARASITES,))
 
 
     test("Parasite result: none",
@@ -646,7 +1259,8 @@ def plugin_func(image, drawable):
     test("GFile result is empty string",
         # Since new image not exported, should return empty string
         '(gimp-image-get-exported-file (car (gimp-image-new 10 30 1)))',
-        "success")
+        "success",
+        mutates=(STATE_IMAGES,))
 
     test("GFile result is nonempty string",
         '(gimp-temp-file "txt")',
@@ -681,7 +1295,8 @@ def plugin_func(image, drawable):
     test("ObjectArray result",
         # get layers of a new image
         '(gimp-image-get-layers (car (gimp-image-new 10 30 1)))',
-        "success")
+        "success",
+        mutates=(STATE_IMAGES,))
 
     '''
     Sidebar:  writing to console.
@@ -706,6 +1321,52 @@ def plugin_func(image, drawable):
     # write a plugin that takes and returns all types
     # repetitively call it with fuzzed args
 
+
+def plugin_func(image, drawable):
+    print("plugin_func called")
+
+    global isolation_fixture, memo, memo_context
+
+    # Roll back state after each case
+    do_isolate_cases = True
+
+    # Fuzz the cases after running them, for this many evaluations
+    do_fuzz = False
+    fuzz_budget = 500
+
+    # Answer cacheable constructs from results of earlier runs of the same GIMP build
+    do_memoize = False
+
+    # Cases mutate image 1 and its active drawable, by literal ID
+    if do_isolate_cases and image.ID != 1:
+        print(f"Cases not isolated: image has ID {image.ID}, cases mutate image with ID 1")
+        do_isolate_cases = False
+    if do_isolate_cases:
+        isolation_fixture = (image, pdb.gimp_image_get_active_drawable(image))
+    if do_memoize:
+        build_signature = gimp_build_signature()
+        if build_signature is None:
+            print("Not memoizing: files of the GIMP build not found")
+        else:
+            memo = load_memo()
+            memo_context = [build_signature, fixture_signature(image, drawable, do_isolate_cases)]
+
+    # One undo step for the whole run. Isolated cases are not in it.
+    pdb.gimp_image_undo_group_start(image)
+    try:
+        run_cases()
+
+        if do_fuzz:
+            fuzz(fuzz_budget)
+    finally:
+        isolation_fixture = None
+        pdb.gimp_image_undo_group_end(image)
+
+        if memo is not None:
+            print(f"Memo: {memo_hits} results answered without evaluating")
+            save_memo()
+            memo = None
+
     #TODO return a value if all tests passed
 
     print(">>>>>>>>>>> Test Gimp Scriptfu Binding: Summary <<<<<<<<<<<<<<<<")
@@ -732,4 +1393,21 @@ register(
     [],
     plugin_func,
     menu="<Image>/Test")
+
+register(
+    "python-fu--script-fu-binding-stress",
+    "Stress ScriptFu with concurrent clients",
+    "One client. Start it several times, to run clients in parallel. Non-interactive.  Start in a console.",
+    "Lloyd Konneker",
+    "copyright",
+    "2021",
+    "ScriptFu binding stress client",
+    "*",
+    [
+      (PF_IMAGE, "image", "Input image", None),
+      (PF_DRAWABLE, "drawable", "Input drawable", None),
+    ],
+    [],
+    stress_func,
+    menu="<Image>/Test")
 main()